@@ -12,23 +12,26 @@ __all__ = [
     'aiohttp', 'BeautifulSoup', 'SoupStrainer',
     'load_dotenv', 'Bot', 'Dispatcher', 
     'Message', 'InlineKeyboardMarkup', 'InlineKeyboardButton', 'CallbackQuery',
-    'Command', 'CommandObject', 'DefaultBotProperties',
+    'Command', 'CommandObject', 'DefaultBotProperties', 'AiohttpSession',
     
     # Config constants
-    'CHAT_ID', 'TELEGRAM_BOT_TOKEN', 'load_website_configs',
+    'CHAT_ID', 'TELEGRAM_BOT_TOKEN', 'TELEGRAM_CONNECTION_LIMIT', 'load_website_configs',
     
     # Storage
-    'storage', 'save_website_data', 'save_last_number', 'load_website_data',
+    'storage', 'save_website_data', 'save_last_number', 'load_website_data', 'cancel_background_tasks', 'flush_website_data',
     
     # Utils
-    'delete_message_after_delay', 'parse_website_content', 'fetch_url_content',
+    'delete_message_after_delay', 'edit_reply_markup_if_changed', 'parse_website_content', 'fetch_url_content',
     
     # Notifications
     'get_buttons', 'get_multiple_buttons', 'get_buttons_by_position', 'send_notification',
     
     # Monitoring
-    'WebsiteMonitor', 'monitor_websites',
+    'WebsiteMonitor', 'monitor_websites', 'stop_monitoring',
     
     # Handlers
-    'register_handlers', 'send_startup_message'
+    'register_handlers', 'send_startup_message',
+
+    # API
+    'close_session'
 ]
@@ -3,6 +3,25 @@ import time
 from typing import Dict, Optional, List, Tuple
 from bot.config import API_KEY, URL, debug_print, parse_url_array
 
+# Shared HTTP session so API calls and page fetches reuse pooled connections
+_session: Optional[aiohttp.ClientSession] = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=60)
+        )
+    return _session
+
+async def close_session():
+    """Close the shared HTTP session"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 class APIClient:
     def __init__(self, base_url: str = None, api_key: str = API_KEY):
         """
@@ -46,16 +65,16 @@ class APIClient:
             if self.api_key:
                 params['apikey'] = self.api_key
             
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method=method,
-                    url=url,
-                    params=params
-                ) as response:
-                    response.raise_for_status()
-                    return await response.json()
+            session = await get_session()
+            async with session.request(
+                method=method,
+                url=url,
+                params=params
+            ) as response:
+                response.raise_for_status()
+                return await response.json()
         except aiohttp.ClientError as e:
-            debug_print(f"Error making request: {e}")
+            debug_print("Error making request: %s", e)
             return None
 
     async def get_numbers(self, country: int = None) -> Dict:
@@ -106,12 +125,12 @@ class APIClient:
                 'z': int(time.time() * 1000)  # Current timestamp in milliseconds
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(target_url, params=params) as response:
-                    response.raise_for_status()
-                    data = await response.json()
-                    return [item['number'] for item in data if 'number' in item]
+            session = await get_session()
+            async with session.get(target_url, params=params) as response:
+                response.raise_for_status()
+                data = await response.json()
+                return [item['number'] for item in data if 'number' in item]
                     
         except Exception as e:
-            debug_print(f"Error fetching numbers from JSON API: {e}")
+            debug_print("Error fetching numbers from JSON API: %s", e)
             return [] 
\ No newline at end of file
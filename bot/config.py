@@ -1,4 +1,5 @@
 import os
+import logging
 from typing import Dict, Any
 from dotenv import load_dotenv
 
@@ -15,16 +16,28 @@ URL = os.getenv("URL")  # Can be a single URL or an array of URLs
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 5))
 SINGLE_MODE = os.getenv("SINGLE_MODE", "false").lower() == "true"
 API_KEY = os.getenv("API_KEY")
+# fsync the website data file on every write (safer on power loss, slower)
+DURABLE_SAVES = os.getenv("DURABLE_SAVES", "false").lower() == "true"
+# Connection pool size for Telegram API calls, kept apart from the scraping pool
+TELEGRAM_CONNECTION_LIMIT = int(os.getenv("TELEGRAM_CONNECTION_LIMIT", 32))
 
 # Development mode - controls whether debug messages are printed
 # Set to True via environment variable to enable debug prints
 DEV_MODE = os.getenv("DEV_MODE", "False").lower() == "true"
 
-# Custom debug print function that only prints when DEV_MODE is True
-def debug_print(*args, **kwargs):
-    """Print debug messages only when DEV_MODE is enabled"""
-    if DEV_MODE:
-        print(*args, **kwargs)
+# Package logger; its children (bot.notifications, ...) inherit this level
+logger = logging.getLogger("bot")
+logger.setLevel(logging.DEBUG if DEV_MODE else logging.WARNING)
+
+# Debug output goes through logging, so it is only formatted when DEV_MODE is True
+def debug_print(message, *args):
+    """Log debug messages, shown only when DEV_MODE is enabled
+
+    Extra positional args are %-formatted into message by logging only when
+    the record is emitted, so hot paths can pass values instead of building
+    an f-string up front.
+    """
+    logger.debug(message, *args)
 
 # Function to parse array-formatted URL string
 def parse_url_array(url_str):
@@ -9,16 +9,19 @@ from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMar
 from bot.config import (
     CHAT_ID, DEV_MODE, SINGLE_MODE, debug_print
 )
-from bot.notifications import create_keyboard, caption_message
+from bot.notifications import create_keyboard
 from bot.storage import (
     save_last_number, save_website_data, storage, get_notification_state,
-    update_notification_state
+    get_notification_state_by_message, track_background_task, update_notification_state
 )
 from bot.utils import (
-    KeyboardData, delete_message_after_delay, extract_website_name, format_phone_number,
-    get_base_url, get_selected_numbers_for_buttons, parse_callback_data
+    KeyboardData, delete_message_after_delay, edit_reply_markup_if_changed, extract_website_name, format_phone_number,
+    get_base_url, get_current_page, get_selected_numbers_for_buttons, parse_callback_data
 )
 
+# Last monitoring keyboard per (page, site_id), stored as (signature, InlineKeyboardMarkup)
+_monitoring_keyboard_cache = {}
+
 def register_handlers(dp: Dispatcher):
     """Register all handlers"""
     # Callback queries
@@ -40,7 +43,7 @@ def register_handlers(dp: Dispatcher):
         lambda c: c.data.startswith("back_to_main_"))
     dp.callback_query.register(
         split_number,
-        lambda c: c.data.startswith("split_") or c.data.startswith("number_"))
+        lambda c: c.data.startswith(("split_", "number_")))
 
     # Commands
     dp.message.register(send_log, Command("log"))
@@ -55,47 +58,51 @@ async def handle_settings(callback_query: CallbackQuery):
             await callback_query.answer("Site ID missing or invalid. Please try again.")
             return
 
-        debug_print(f"[DEBUG] Settings - extracted site_id: {site_id}")
+        debug_print("[DEBUG] Settings - extracted site_id: %s", site_id)
 
         # Get website configuration
         website = storage["websites"].get(site_id)
-        debug_print(f"[INFO] handle_settings - website found: {website is not None}")
+        debug_print("[INFO] handle_settings - website found: %s", website is not None)
 
         if not website:
             await callback_query.answer("Website not found.")
             return
 
-        # Determine if repeat notification is enabled
-        single_mode_status = "Disable" if SINGLE_MODE else "Enable"
-
-        # Define base buttons that are common for all types
-        base_buttons = [
-            [InlineKeyboardButton(
-                text="Stop Monitoring",
-                callback_data=f"settings_monitoring_{site_id}")
-            ],
-            [InlineKeyboardButton(
-                text="« Back",
-                callback_data=f"back_to_main_{site_id}")
+        # The menu only depends on the website type and SINGLE_MODE, so build it once per combination
+        settings_key = (website.type, SINGLE_MODE)
+        settings_keyboard = website._settings_keyboard_cache.get(settings_key)
+        if settings_keyboard is None:
+            # Determine if repeat notification is enabled
+            single_mode_status = "Disable" if SINGLE_MODE else "Enable"
+
+            # Define base buttons that are common for all types
+            base_buttons = [
+                [InlineKeyboardButton(
+                    text="Stop Monitoring",
+                    callback_data=f"settings_monitoring_{site_id}")
+                ],
+                [InlineKeyboardButton(
+                    text="« Back",
+                    callback_data=f"back_to_main_{site_id}")
+                ]
             ]
-        ]
 
-        # Add single mode button only for multiple type websites
-        if website.type == "multiple":
-            base_buttons.insert(1, [InlineKeyboardButton(
-                text=f"Single Mode : {single_mode_status}",
-                callback_data=f"toggle_single_mode_{site_id}")
-            ])
+            # Add single mode button only for multiple type websites
+            if website.type == "multiple":
+                base_buttons.insert(1, [InlineKeyboardButton(
+                    text=f"Single Mode : {single_mode_status}",
+                    callback_data=f"toggle_single_mode_{site_id}")
+                ])
 
-        # Create settings keyboard
-        settings_keyboard = InlineKeyboardMarkup(inline_keyboard=base_buttons)
+            # Create settings keyboard
+            settings_keyboard = InlineKeyboardMarkup(inline_keyboard=base_buttons)
+            website._settings_keyboard_cache[settings_key] = settings_keyboard
 
         # Update message with settings menu
-        await callback_query.message.edit_reply_markup(
-            reply_markup=settings_keyboard)
+        await edit_reply_markup_if_changed(callback_query.message, settings_keyboard)
 
     except Exception as e:
-        debug_print(f"[ERROR] Error in handle_settings: {e}")
+        debug_print("[ERROR] Error in handle_settings: %s", e)
 
 
 async def create_monitoring_keyboard(current_page: int, total_sites: int, all_sites: list, site_id: str) -> InlineKeyboardMarkup:
@@ -117,36 +124,38 @@ async def create_monitoring_keyboard(current_page: int, total_sites: int, all_si
     # Get sites for current page
     current_page_sites = all_sites[start_idx:end_idx]
 
-    debug_print(f"[DEBUG] create_monitoring_keyboard - displaying page {current_page+1}/{total_pages}, sites {start_idx+1}-{end_idx} of {total_sites}")
+    # Reuse the previous keyboard while the page's sites and their status are unchanged
+    signature = (total_sites, tuple((target_id, site.url, site.type, site.enabled) for target_id, site in current_page_sites))
+    cached = _monitoring_keyboard_cache.get((current_page, site_id))
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    debug_print("[DEBUG] create_monitoring_keyboard - displaying page %s/%s, sites %s-%s of %s", current_page + 1, total_pages, start_idx + 1, end_idx, total_sites)
+
+    # Callback data is always prefix + target_id + suffix, so build the fixed parts once
+    # (the original site_id is kept for state)
+    if use_pagination:
+        callback_prefix = f"toggle_monitoring_page_{current_page}_"
+    else:
+        callback_prefix = "toggle_monitoring_"
+    callback_suffix = "_" + site_id
 
     # Create buttons for each website
-    buttons = []
-    current_row = []
+    site_buttons = []
 
     for target_id, site in current_page_sites:
         # Extract website name from URL and format with status
         status = "Disabled" if not site.enabled else "Enable"
         site_name = extract_website_name(site.url, site.type, button_format=True, status=status)
-        debug_print(f"[DEBUG] create_monitoring_keyboard - site_name: {site_name}, enabled: {site.enabled}")
-
-        # Create callback data with consistent format - always use original site_id for state
-        if use_pagination:
-            callback_data = f"toggle_monitoring_page_{current_page}_{target_id}_{site_id}"
-        else:
-            callback_data = f"toggle_monitoring_{target_id}_{site_id}"
+        debug_print("[DEBUG] create_monitoring_keyboard - site_name: %s, enabled: %s", site_name, site.enabled)
 
-        current_row.append(
+        site_buttons.append(
             InlineKeyboardButton(
                 text=site_name,
-                callback_data=callback_data))
-
-        if len(current_row) == SITES_PER_ROW:
-            buttons.append(current_row)
-            current_row = []
+                callback_data=callback_prefix + target_id + callback_suffix))
 
-    # Add any remaining buttons if we have an odd number
-    if current_row:
-        buttons.append(current_row)
+    # Group buttons into rows of SITES_PER_ROW (the last row may be shorter)
+    buttons = [site_buttons[i:i + SITES_PER_ROW] for i in range(0, len(site_buttons), SITES_PER_ROW)]
 
     # Add pagination navigation
     if use_pagination:
@@ -180,7 +189,9 @@ async def create_monitoring_keyboard(current_page: int, total_sites: int, all_si
             callback_data=f"settings_{site_id}")
     ])
 
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    _monitoring_keyboard_cache[(current_page, site_id)] = (signature, keyboard)
+    return keyboard
 
 
 async def handle_monitoring_settings(callback_query: CallbackQuery):
@@ -191,7 +202,7 @@ async def handle_monitoring_settings(callback_query: CallbackQuery):
             await callback_query.answer("Invalid monitoring settings request")
             return
 
-        debug_print(f"[INFO] Monitoring settings - site_id: {site_id}")
+        debug_print("[INFO] Monitoring settings - site_id: %s", site_id)
 
         # Get all websites
         all_sites = list(storage["websites"].items())
@@ -202,23 +213,16 @@ async def handle_monitoring_settings(callback_query: CallbackQuery):
             return
 
         # Calculate current page
-        current_page = 0
-        if "page" in callback_query.data:
-            page_index = parts.index("page")
-            if page_index + 1 < len(parts):
-                try:
-                    current_page = int(parts[page_index + 1])
-                except ValueError:
-                    current_page = 0
+        current_page = get_current_page(parts)
 
         # Create monitoring settings keyboard
         monitoring_keyboard = await create_monitoring_keyboard(current_page, total_sites, all_sites, site_id)
 
         # Update the message with new keyboard
-        await callback_query.message.edit_reply_markup(reply_markup=monitoring_keyboard)
+        await edit_reply_markup_if_changed(callback_query.message, monitoring_keyboard)
 
     except Exception as e:
-        debug_print(f"[ERROR] Error in monitoring settings: {e}")
+        debug_print("[ERROR] Error in monitoring settings: %s", e)
         print(f"[ERROR] Error in monitoring settings: {e}")
 
 
@@ -227,10 +231,11 @@ async def toggle_site_monitoring(callback_query: CallbackQuery):
     try:
         # Extract both target and original site_ids from callback data
         parts = callback_query.data.split('_')
-        debug_print(f"[DEBUG] toggle_site_monitoring - callback data parts: {parts}")
+        debug_print("[DEBUG] toggle_site_monitoring - callback data parts: %s", parts)
         
         # Handle both page and non-page formats
-        if "page" in callback_query.data:
+        is_paged = len(parts) > 2 and parts[2] == "page"
+        if is_paged:
             # Format: toggle_monitoring_page_[page_num]_site_[id]_site_[id]
             if len(parts) < 6:
                 await callback_query.answer("Invalid toggle request")
@@ -245,11 +250,12 @@ async def toggle_site_monitoring(callback_query: CallbackQuery):
             target_id = f"site_{parts[3]}"   # Combine 'site' and id
             site_id = f"site_{parts[-1]}"    # Combine 'site' and id
         
-        debug_print(f"[INFO] Toggle site monitoring - toggling site: {target_id}")
+        debug_print("[INFO] Toggle site monitoring - toggling site: %s", target_id)
 
         # Toggle the site's enabled status
-        if target_id in storage["websites"]:
-            website = storage["websites"][target_id]
+        websites = storage["websites"]
+        website = websites.get(target_id)
+        if website:
             website.enabled = not website.enabled
 
             # Log the monitoring status change
@@ -258,24 +264,17 @@ async def toggle_site_monitoring(callback_query: CallbackQuery):
             print(f"Monitoring {status} for {website_name} Website")
 
             # Get all websites
-            all_sites = list(storage["websites"].items())
+            all_sites = list(websites.items())
             total_sites = len(all_sites)
 
             # Calculate current page
-            current_page = 0
-            if "page" in callback_query.data:
-                page_index = parts.index("page")
-                if page_index + 1 < len(parts):
-                    try:
-                        current_page = int(parts[page_index + 1])
-                    except ValueError:
-                        current_page = 0
+            current_page = get_current_page(parts) if is_paged else 0
 
             # Create monitoring settings keyboard using original site_id
             monitoring_keyboard = await create_monitoring_keyboard(current_page, total_sites, all_sites, site_id)
 
             # Update the keyboard
-            await callback_query.message.edit_reply_markup(reply_markup=monitoring_keyboard)
+            await edit_reply_markup_if_changed(callback_query.message, monitoring_keyboard)
 
             # Save the updated website data
             await save_website_data(target_id)
@@ -285,7 +284,7 @@ async def toggle_site_monitoring(callback_query: CallbackQuery):
         else:
             await callback_query.answer(f"Error: Website {target_id} not found")
     except Exception as e:
-        debug_print(f"[ERROR] Error in toggle_site_monitoring: {e}")
+        debug_print("[ERROR] Error in toggle_site_monitoring: %s", e)
         await callback_query.answer("Error toggling site monitoring")
 
 
@@ -297,7 +296,7 @@ async def back_to_main(callback_query: CallbackQuery):
             await callback_query.answer("Site ID missing or invalid.")
             return
 
-        debug_print(f"[DEBUG] back_to_main - site_id: {site_id}")
+        debug_print("[DEBUG] back_to_main - site_id: %s", site_id)
         
         # Get website data
         website = storage["websites"].get(site_id)
@@ -307,31 +306,27 @@ async def back_to_main(callback_query: CallbackQuery):
 
         # Find notification state by message_id
         message_id = callback_query.message.message_id
-        notification_state = next(
-            (state for state in storage["notifications"].values() 
-             if state.message_id == message_id and state.site_id == site_id),
-            None
-        )
+        notification_state = get_notification_state_by_message(message_id)
                 
-        if not notification_state:
+        if not notification_state or notification_state.site_id != site_id:
             debug_print("[ERROR] back_to_main - No notification state found for this message")
             await callback_query.answer("Error: State not found")
             return
             
-        debug_print(f"[DEBUG] back_to_main - Using notification state: {notification_state}")
+        debug_print("[DEBUG] back_to_main - Using notification state: %s", notification_state)
         
-        # Create and update keyboard
-        keyboard = await create_keyboard(notification_state.to_keyboard_data(website.url), website)
+        # Reuse the keyboard sent with this message, rebuilding only if it is missing
+        keyboard = notification_state.keyboard or await create_keyboard(notification_state.to_keyboard_data(website.url), website)
         if not keyboard:
             debug_print("[ERROR] back_to_main - Failed to create keyboard")
             await callback_query.answer("Error: Could not create keyboard")
             return
 
-        await callback_query.message.edit_reply_markup(reply_markup=keyboard)
+        await edit_reply_markup_if_changed(callback_query.message, keyboard)
         await callback_query.answer("Returned to main view.")
         
     except Exception as e:
-        debug_print(f"[ERROR] back_to_main - error: {e}")
+        debug_print("[ERROR] back_to_main - error: %s", e)
         await callback_query.answer("An error occurred while returning to main view")
 
 
@@ -340,12 +335,12 @@ async def split_number(callback_query: CallbackQuery):
         # Extract number and site_id from callback data
         parts, site_id = parse_callback_data(callback_query.data)
         if len(parts) != 2 or not site_id:  # split_number or number_number
-            debug_print(f"[ERROR] split_number - invalid format, parts: {parts}, site_id: {site_id}")
+            debug_print("[ERROR] split_number - invalid format, parts: %s, site_id: %s", parts, site_id)
             await callback_query.answer("Invalid format")
             return
 
         number = parts[1]
-        debug_print(f"[DEBUG] split_number - extracted number: {number}, site_id: {site_id}")
+        debug_print("[DEBUG] split_number - extracted number: %s, site_id: %s", number, site_id)
 
         # Remove country code from the number
         number_without_country_code = await format_phone_number(number, remove_code=True)
@@ -358,13 +353,13 @@ async def split_number(callback_query: CallbackQuery):
             parse_mode="Markdown")
 
         # Create a task to delete the message after 30 seconds
-        asyncio.create_task(
-            delete_message_after_delay(callback_query.bot, temp_message, 30))
+        track_background_task(asyncio.create_task(
+            delete_message_after_delay(callback_query.bot, temp_message, 30)))
 
         await callback_query.answer("Number split!")  # Show feedback to user
 
     except Exception as e:
-        debug_print(f"Error in split_number: {e}")
+        debug_print("Error in split_number: %s", e)
         await callback_query.answer("Error splitting number")
 
 async def send_log(message: Message):
@@ -381,7 +376,7 @@ async def send_startup_message(bot):
         try:
             await bot.send_message(CHAT_ID, text="At Your Service 🍒🍄")
         except Exception as e:
-            debug_print(f"⚠️ Failed to send startup message: {e}")
+            debug_print("⚠️ Failed to send startup message: %s", e)
 
 
 async def toggle_single_mode(callback_query: CallbackQuery):
@@ -410,7 +405,7 @@ async def toggle_single_mode(callback_query: CallbackQuery):
                         else:
                             f.write(line)
             except Exception as e:
-                debug_print(f"[WARNING] Could not update config file: {e}")
+                debug_print("[WARNING] Could not update config file: %s", e)
                 # Continue execution even if config file update fails
         else:
             debug_print("[INFO] No config file found, using environment variable only")
@@ -420,5 +415,5 @@ async def toggle_single_mode(callback_query: CallbackQuery):
         await callback_query.answer(f"Single Mode {'Enabled' if SINGLE_MODE else 'Disabled'}")
 
     except Exception as e:
-        debug_print(f"[ERROR] Error in toggle_single_mode: {e}")
+        debug_print("[ERROR] Error in toggle_single_mode: %s", e)
         await callback_query.answer("Failed to toggle Single Mode")
\ No newline at end of file
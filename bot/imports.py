@@ -13,6 +13,7 @@ from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, C
 from aiogram.filters import Command
 from aiogram.filters.command import CommandObject
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 
 # Module-specific common imports
 # Config constants used across modules
@@ -22,19 +23,22 @@ from bot.config import CHAT_ID, DEV_MODE, debug_print, load_website_configs, SIN
 from bot.storage import storage, save_website_data, save_last_number
 
 # UI and utility functions used across modules
-from bot.utils import delete_message_after_delay, parse_website_content, fetch_url_content
+from bot.utils import delete_message_after_delay, edit_reply_markup_if_changed, parse_website_content, fetch_url_content
 
 # Notification functions used across modules
 from bot.notifications import send_notification
 
 # Additional monitoring imports
-from bot.monitoring import WebsiteMonitor, monitor_websites
+from bot.monitoring import WebsiteMonitor, monitor_websites, stop_monitoring
 
 # Handler functions
 from bot.handlers import register_handlers, send_startup_message
 
 # Additional config constants
-from bot.config import TELEGRAM_BOT_TOKEN
+from bot.config import TELEGRAM_BOT_TOKEN, TELEGRAM_CONNECTION_LIMIT
 
 # Additional storage functions
-from bot.storage import load_website_data
+from bot.storage import load_website_data, cancel_background_tasks, flush_website_data
+
+# Shared HTTP session cleanup
+from bot.api import close_session
@@ -1,9 +1,13 @@
 import asyncio
+import time
 from typing import Dict, Any, List, Optional, Union, Tuple
 from bot.storage import storage, save_website_data, load_website_data
 from bot.utils import parse_website_content, fetch_url_content
 from bot.config import CHECK_INTERVAL, debug_print, DEV_MODE
 
+# Longest pause for a site that keeps raising errors, in multiples of CHECK_INTERVAL
+MAX_FAILURE_BACKOFF_INTERVALS = 4
+
 class WebsiteMonitor:
     def __init__(self, site_id: str, config: Dict[str, Any]):
         self.site_id = site_id
@@ -23,6 +27,14 @@ class WebsiteMonitor:
             "single_mode": False,
             "buttons": None  # Store the actual keyboard buttons
         }
+        # Prebuilt Settings / Visit Webpage buttons keyed by (site_id, url)
+        self._static_buttons_cache = {}
+        # Last built keyboard as (key, InlineKeyboardMarkup)
+        self._keyboard_cache = None
+        # Prebuilt settings menu keyboards keyed by (type, single_mode)
+        self._settings_keyboard_cache = {}
+        # latest_numbers list and its set, rebuilt only when the list is replaced
+        self._latest_numbers_set = (None, set())
 
     def update_keyboard_state(self, numbers=None, is_initial_run=None, single_mode=None):
         """Update keyboard state without recreating the entire keyboard"""
@@ -41,6 +53,12 @@ class WebsiteMonitor:
         """Store the keyboard buttons for reuse"""
         self.keyboard_state["buttons"] = buttons
 
+    def get_latest_numbers_set(self) -> set:
+        """Get latest_numbers as a set, reusing it until the list is replaced"""
+        if self._latest_numbers_set[0] is not self.latest_numbers:
+            self._latest_numbers_set = (self.latest_numbers, set(self.latest_numbers))
+        return self._latest_numbers_set[1]
+
     async def fetch_content(self) -> Optional[str]:
         """Fetch content from the website"""
         return await fetch_url_content(self.url)
@@ -80,7 +98,7 @@ class WebsiteMonitor:
         """Process updates and return True if notification should be sent"""
         if not new_data:
             # Website temporarily unavailable, don't disrupt monitoring
-            debug_print(f"[DEBUG] No data from {self.site_id}, skipping this check")
+            debug_print("[DEBUG] No data from %s, skipping this check", self.site_id)
             return False
 
         # Dynamic type detection if not set
@@ -104,10 +122,9 @@ class WebsiteMonitor:
                 await self._update_state(new_data, flag_url)
                 return True
         else:  # multiple type
-            current_numbers = set(self.latest_numbers)
             new_numbers = set(new_data if isinstance(new_data, list) else [new_data])
             
-            if current_numbers != new_numbers:
+            if self.get_latest_numbers_set() != new_numbers:
                 await self._update_state(new_data, flag_url)
                 return True
 
@@ -137,12 +154,15 @@ async def monitor_websites(bot, send_notification_func):
     # Load saved data for all websites
     await load_website_data()
 
-    consecutive_failures = {site_id: 0 for site_id in storage["websites"]}
+    websites = storage["websites"]
+    consecutive_failures = {site_id: 0 for site_id in websites}
     max_consecutive_failures = 5
+    # Monotonic time before which a repeatedly failing site is skipped
+    retry_after = {}
 
     # First run check - if any website has no saved data, initialize it
     initial_run_needed = False
-    for site_id, website in storage["websites"].items():
+    for site_id, website in websites.items():
         # Only set is_initial_run to True if the website hasn't been initialized yet
         if website.enabled and website.type == "single" and website.last_number is None:
             website.is_initial_run = True
@@ -172,47 +192,74 @@ async def monitor_websites(bot, send_notification_func):
                 # Don't increase failure count on first run
         
         # Create tasks for all websites and run them in parallel
-        init_tasks = [init_website(site_id, website) for site_id, website in storage["websites"].items()]
+        init_tasks = [init_website(site_id, website) for site_id, website in websites.items()]
         await asyncio.gather(*init_tasks)
 
-    # For normal operation, start monitoring loop
-    while True:
+    def record_failure(site_id):
+        """Count a check that raised and back off the site once errors pile up"""
+        failures = consecutive_failures[site_id] = consecutive_failures.get(site_id, 0) + 1
+        if failures >= max_consecutive_failures:
+            backoff = CHECK_INTERVAL * min(2 ** (failures - max_consecutive_failures), MAX_FAILURE_BACKOFF_INTERVALS)
+            retry_after[site_id] = time.monotonic() + backoff
+            debug_print("[WARNING] %s failed %s times in a row, pausing it for %ss", site_id, failures, backoff)
+        return failures
+
+    # Define a task to check a single website (defined once, reused every cycle)
+    async def check_website(site_id, website):
         try:
-            # Get all enabled websites
-            enabled_websites = [(site_id, website) for site_id, website in storage["websites"].items() 
-                               if website.enabled]
-            
-            # Define a task to check a single website
-            async def check_website(site_id, website):
-                try:
-                    # Check for updates
-                    new_data, flag_url = await website.check_for_updates()
-
-                    if new_data:
-                        # Process update and send notification
-                        notify = await website.process_update(new_data, flag_url)
-
-                        if notify:
-                            notification_data = website.get_notification_data()
-                            await send_notification_func(notification_data)
-                        
-                        # Reset consecutive failures on any successful response
-                        consecutive_failures[site_id] = 0
-                    else:
-                        consecutive_failures[site_id] += 1
-
-                except Exception as e:
-                    consecutive_failures[site_id] += 1
-                    print(f"Error monitoring {site_id} (attempt {consecutive_failures[site_id]}): {e}")
+            # Check for updates
+            new_data, flag_url = await website.check_for_updates()
+
+            if new_data:
+                # Process update and send notification
+                notify = await website.process_update(new_data, flag_url)
+
+                if notify:
+                    notification_data = website.get_notification_data()
+                    await send_notification_func(notification_data)
+                
+            # A site showing no numbers is normal, so only errors count towards the backoff;
+            # any response clears it and keeps the site on CHECK_INTERVAL
+            consecutive_failures[site_id] = 0
+            retry_after.pop(site_id, None)
+
+        except Exception as e:
+            failures = record_failure(site_id)
+            print(f"Error monitoring {site_id} (attempt {failures}): {e}")
+
+    # For normal operation, start monitoring loop (runs until stop_monitoring is called)
+    stop_event = storage["stop_event"]
+    while not stop_event.is_set():
+        # Schedule from the start of the cycle so check time doesn't stretch the interval
+        next_check = time.monotonic() + CHECK_INTERVAL
+        try:
+            # Get all enabled websites that are not backing off after repeated failures
+            now = time.monotonic()
+            enabled_websites = [(site_id, website) for site_id, website in websites.items() 
+                               if website.enabled and retry_after.get(site_id, 0) <= now]
             
             # Create tasks for all enabled websites and run them in parallel
             tasks = [check_website(site_id, website) for site_id, website in enabled_websites]
             if tasks:
                 await asyncio.gather(*tasks)
 
-            # Wait for CHECK_INTERVAL seconds before checking again
-            await asyncio.sleep(CHECK_INTERVAL)
+            # Wait out the rest of CHECK_INTERVAL before checking again
+            await wait_for_stop(max(0, next_check - time.monotonic()))
         except Exception as e:
             print(f"[ERROR] Error in monitor_websites main loop: {e}")
             # Continue monitoring even if there's an error in the main loop
-            await asyncio.sleep(5)
+            await wait_for_stop(5)
+
+
+async def wait_for_stop(timeout: float) -> bool:
+    """Sleep up to timeout seconds, returning True early if monitoring was stopped"""
+    try:
+        await asyncio.wait_for(storage["stop_event"].wait(), timeout=timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def stop_monitoring():
+    """Stop the monitor_websites loop at its next wait"""
+    storage["stop_event"].set()
@@ -1,29 +1,53 @@
-import os
-import re
 import asyncio
+import logging
+import re
 import time
 import aiohttp
-from typing import Union, List
+from typing import Union, List, Optional
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
 from bot.storage import (
     storage, save_website_data, create_notification_state, get_notification_state, update_notification_state
 )
 
 from bot.config import CHAT_ID, debug_print, DEV_MODE, SINGLE_MODE
-from bot.utils import get_base_url, format_phone_number, get_selected_numbers_for_buttons, KeyboardData, extract_website_name
+from bot.utils import (
+    get_base_url, format_phone_number, get_selected_numbers_for_buttons, KeyboardData, extract_website_name, RateLimiter
+)
+
+logger = logging.getLogger(__name__)
+
+# Sends per second; every message goes to CHAT_ID, and Telegram allows about one message per second per chat
+TELEGRAM_SEND_RATE = 1
+_send_limiter = RateLimiter(TELEGRAM_SEND_RATE)
+
+# Button texts shared by every notification keyboard
+SETTINGS_BUTTON_TEXT = "⚙️ Settings"
+VISIT_BUTTON_TEXT = "🌐 Visit Webpage : %s"
 
-def caption_message(number: Union[str, List[str]], include_time: bool = False, is_single: bool = True) -> str:
+# Pattern dropping whitespace (Unicode included) and dashes from caption numbers, compiled once at import
+CAPTION_STRIP = re.compile(r'[\s\-]')
+
+# Caption templates, defined once at import and filled with a single % substitution
+SINGLE_CAPTION = "🎁 *New Number Added* 🎁\n\n`%s` check it out! 💖"
+MULTIPLE_CAPTION = "🎁 *New Numbers Added* 🎁\n\nFound `%d` numbers, check them out! 💖"
+
+# Retries for a notification send that hit a network timeout or flood limit
+SEND_RETRIES = 3
+SEND_RETRY_DELAY = 0.5  # Doubled after each network failure
+
+# Telegram file_id of each flag image already uploaded, keyed by flag URL
+_flag_file_ids = {}
+
+def caption_single(number: str) -> str:
+    """Caption for a notification showing one number"""
     # Filter spaces and dashes if included
-    number = re.sub(r'[\s\-]', '', str(number))
+    return SINGLE_CAPTION % CAPTION_STRIP.sub('', str(number))
 
-    if is_single:
-        message = f"🎁 *New Number Added* 🎁\n\n`{number}` check it out! 💖"
-    else:
-        numbers = number if isinstance(number, list) else [number]
-        message = f"🎁 *New Numbers Added* 🎁\n\nFound `{len(numbers)}` numbers, check them out! 💖"
-    
-    return message
+def caption_multiple(numbers: List[str]) -> str:
+    """Caption for a notification showing several numbers"""
+    return MULTIPLE_CAPTION % len(numbers)
 
 async def create_keyboard(data: Union[dict, KeyboardData], website) -> InlineKeyboardMarkup:
     """Create a keyboard layout based on website type"""
@@ -33,7 +57,7 @@ async def create_keyboard(data: Union[dict, KeyboardData], website) -> InlineKey
             data = KeyboardData(**data)
 
         # Validate required fields
-        if not all([data.site_id, data.type, data.url]):
+        if not (data.site_id and data.type and data.url):
             debug_print("[ERROR] create_keyboard - Missing required fields")
             return None
 
@@ -44,6 +68,11 @@ async def create_keyboard(data: Union[dict, KeyboardData], website) -> InlineKey
             single_mode=data.single_mode
         )
 
+        # Reuse the last keyboard if it was built from the same inputs
+        cache_key = (data.site_id, data.type, tuple(data.numbers), data.is_initial_run, data.single_mode, data.url)
+        if website._keyboard_cache and website._keyboard_cache[0] == cache_key:
+            return website._keyboard_cache[1]
+
         buttons = []
         
         # Common layout for both single and multiple types
@@ -60,44 +89,92 @@ async def create_keyboard(data: Union[dict, KeyboardData], website) -> InlineKey
                 ])
             else:
                 # For subsequent runs without SINGLE_MODE, show numbers in pairs
-                current_row = []
-                for i, number in enumerate(data.numbers):
-                    formatted_number = await format_phone_number(number, website_url=website.url)
-                    current_row.append(
-                        InlineKeyboardButton(
-                            text=f"{formatted_number}",
-                            callback_data=f"split_{number}_{data.site_id}"
-                        )
+                # Loop invariants bound once
+                website_url = website.url
+                site_id = data.site_id
+                # format_phone_number never suspends, so await each call in turn rather than wrapping it in a task
+                number_buttons = [
+                    InlineKeyboardButton(
+                        text=f"{await format_phone_number(number, website_url=website_url)}",
+                        callback_data=f"split_{number}_{site_id}"
+                    )
+                    for number in data.numbers
+                ]
+                buttons.extend(number_buttons[i:i + 2] for i in range(0, len(number_buttons), 2))
+
+        # Common buttons for all types, built once per (site_id, url)
+        static_key = (data.site_id, data.url)
+        static_buttons = website._static_buttons_cache.get(static_key)
+        if static_buttons is None:
+            # Get website name for visit webpage button (always use domain name)
+            website_name = extract_website_name(data.url, data.type, use_domain_only=True)
+            static_buttons = (
+                InlineKeyboardButton(
+                    text=SETTINGS_BUTTON_TEXT,
+                    callback_data=f"settings_{data.site_id}"),
+                InlineKeyboardButton(
+                    text=VISIT_BUTTON_TEXT % website_name,
+                    url=data.url)
+            )
+            website._static_buttons_cache[static_key] = static_buttons
+
+        settings_button, visit_button = static_buttons
+        buttons.extend([[settings_button], [visit_button]])
+
+        keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+        website._keyboard_cache = (cache_key, keyboard)
+        return keyboard
+
+    except Exception as e:
+        debug_print("[ERROR] create_keyboard - Error creating keyboard: %s", e)
+        return None
+
+async def _send_and_store(bot, flag_url, caption, keyboard, notification_id) -> Optional[int]:
+    """Send a notification (photo, or text without a flag) and record its message_id, returning it or None on failure"""
+    try:
+        delay = SEND_RETRY_DELAY
+        for attempt in range(SEND_RETRIES + 1):
+            try:
+                await _send_limiter.wait()
+                if flag_url:
+                    # Reuse the uploaded photo so Telegram does not fetch the flag URL again
+                    sent_message = await bot.send_photo(
+                        CHAT_ID,
+                        photo=_flag_file_ids.get(flag_url, flag_url),
+                        caption=caption,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
+                    )
+                else:
+                    # No flag for this number, so send the caption as a plain message
+                    sent_message = await bot.send_message(
+                        CHAT_ID,
+                        text=caption,
+                        parse_mode="Markdown",
+                        reply_markup=keyboard
                     )
-                    
-                    if len(current_row) == 2 or i == len(data.numbers) - 1:
-                        buttons.append(current_row)
-                        current_row = []
-
-        # Get website name for visit webpage button (always use domain name)
-        website_name = extract_website_name(data.url, data.type, use_domain_only=True)
-
-        # Common buttons for all types
-        buttons.extend([
-            [InlineKeyboardButton(
-                text="⚙️ Settings",
-                callback_data=f"settings_{data.site_id}")],
-            [InlineKeyboardButton(
-                text=f"🌐 Visit Webpage : {website_name}",
-                url=data.url)]
-        ])
-
-        return InlineKeyboardMarkup(inline_keyboard=buttons)
+                break
+            except (TelegramNetworkError, TelegramRetryAfter) as e:
+                if attempt == SEND_RETRIES:
+                    raise
+                wait = e.retry_after if isinstance(e, TelegramRetryAfter) else delay
+                debug_print("[WARNING] send_notification - Send failed (%s), retrying in %ss", e, wait)
+                await asyncio.sleep(wait)
+                delay *= 2
 
+        update_notification_state(notification_id, message_id=sent_message.message_id, keyboard=keyboard)
+        if flag_url and sent_message.photo:
+            _flag_file_ids[flag_url] = sent_message.photo[-1].file_id
+        debug_print("[DEBUG] send_notification - Successfully sent notification with message_id: %s", sent_message.message_id)
+        return sent_message.message_id
     except Exception as e:
-        debug_print(f"[ERROR] create_keyboard - Error creating keyboard: {e}")
+        debug_print("[ERROR] send_notification - Error sending message: %s", e)
         return None
 
 async def send_notification(bot, data):
     """Send notification with appropriate layout based on website type"""
     try:
-        chat_id = os.getenv("CHAT_ID")
-        if not chat_id:
+        if not CHAT_ID:
             debug_print("[ERROR] send_notification - No chat ID found")
             return
 
@@ -111,60 +188,32 @@ async def send_notification(bot, data):
         is_multiple = website.type == "multiple"
         numbers = data.get("numbers", []) if is_multiple else [data.get("number")]
         
-        # Get country code and flag information for the first number
-        country_code = None
         flag_url = data.get("flag_url")  # Get flag URL from the data parameter
 
-        # Format the first number for flag info
-        if numbers:
-            formatted_number, flag_info = await format_phone_number(numbers[0], get_flag=True, website_url=website.url)
-            if flag_info:  # If we got flag info, we definitely got country code
-                country_code = formatted_number.split(' ')[0] if formatted_number else None
+        debug_print("[DEBUG] send_notification - Creating notification state for site: %s", site_id)
 
-        # Prepare notification details for logging
-        button_created_using = (
-            "last_number (initial run)" if website.is_initial_run 
-            else "selected_numbers_for_buttons (subsequent run)" if is_multiple 
-            else "last_number"
-        )
-        
-        debug_print(f"[DEBUG] send_notification - Creating notification state for site: {site_id}")
-
-        async def send_notification_message(number, is_initial=False):
-            """Helper function to send a notification message with a number"""
+        async def send_notification_message(message_numbers, is_initial=False, is_single=True):
+            """Helper function to send one notification message for the given numbers"""
             notification_state = create_notification_state(
                 site_id=site_id,
-                numbers=[number],
+                numbers=message_numbers,
                 type=website.type,
                 is_initial_run=is_initial
             )
             
-            caption = caption_message(number)
+            caption = caption_single(message_numbers[0]) if is_single else caption_multiple(message_numbers)
             keyboard = await create_keyboard(notification_state.to_keyboard_data(website.url), website)
-            debug_print(f"[DEBUG] send_notification - Created keyboard for number: {number}")
+            debug_print("[DEBUG] send_notification - Created keyboard for numbers: %s", message_numbers)
 
-            try:
-                sent_message = await bot.send_photo(
-                    chat_id,
-                    photo=flag_url,
-                    caption=caption,
-                    parse_mode="Markdown",
-                    reply_markup=keyboard
-                )
-                notification_state.set_message_id(sent_message.message_id)
-                debug_print(f"[DEBUG] send_notification - Successfully sent notification with message_id: {sent_message.message_id}")
-                return sent_message.message_id
-            except Exception as e:
-                debug_print(f"[ERROR] send_notification - Error sending message: {e}")
-                return None
+            return await _send_and_store(bot, flag_url, caption, keyboard, notification_state.notification_id)
 
         if not is_multiple:
             # Single number notification
-            if not numbers:
+            if not numbers[0]:
                 debug_print("[ERROR] send_notification - No number provided for single type")
                 return
 
-            message_id = await send_notification_message(numbers[0], website.is_initial_run)
+            message_id = await send_notification_message([numbers[0]], website.is_initial_run)
 
         else:
             # Multiple numbers notification
@@ -173,71 +222,64 @@ async def send_notification(bot, data):
                 return
 
             if website.is_initial_run:
-                debug_print(f"[DEBUG] send_notification - Initial run. is_initial_run: {website.is_initial_run}")
+                debug_print("[DEBUG] send_notification - Initial run. is_initial_run: %s", website.is_initial_run)
                 # Display single number in initial run
-                message_id = await send_notification_message(numbers[0], True)
+                message_id = await send_notification_message([numbers[0]], True)
             else:
                 debug_print("[DEBUG] send_notification - Processing subsequent run for multiple numbers")
                 # For subsequent runs, use selected numbers
                 selected_numbers = get_selected_numbers_for_buttons(numbers, website.previous_last_number)
-                debug_print(f"[DEBUG] send_notification - Selected numbers for buttons: {selected_numbers}")
+                debug_print("[DEBUG] send_notification - Selected numbers for buttons: %s", selected_numbers)
 
                 # Send notification for each number if SINGLE_MODE is enabled
                 if SINGLE_MODE and selected_numbers:
                     debug_print("[DEBUG] send_notification - Sending individual notifications in SINGLE_MODE")
-                    last_message_id = None
+                    # Send in list order so the chat shows the numbers in sequence, paced by the send rate limiter
+                    message_id = None
                     for number in selected_numbers:
-                        last_message_id = await send_notification_message(number, False)
-                        # Add a small delay between notifications to prevent rate limiting
-                        await asyncio.sleep(0.5)
-                    message_id = last_message_id
+                        sent_id = await send_notification_message([number], False)
+                        # Report the last message that was actually posted
+                        if sent_id:
+                            message_id = sent_id
                 else:
                     # Send one notification with all numbers
-                    notification_state = create_notification_state(
-                        site_id=site_id,
-                        numbers=selected_numbers,
-                        type=website.type,
-                        is_initial_run=False
-                    )
-                    
-                    caption = caption_message(selected_numbers, is_single=False)
-                    keyboard = await create_keyboard(notification_state.to_keyboard_data(website.url), website)
-                    debug_print("[DEBUG] send_notification - Created keyboard for subsequent run")
-
-                    try:
-                        debug_print("[DEBUG] send_notification - Attempting to send subsequent run notification")
-                        sent_message = await bot.send_photo(
-                            chat_id,
-                            photo=flag_url,
-                            caption=caption,
-                            parse_mode="Markdown",
-                            reply_markup=keyboard
-                        )
-                        notification_state.set_message_id(sent_message.message_id)
-                        message_id = sent_message.message_id
-                        debug_print(f"[DEBUG] send_notification - Successfully sent subsequent notification with message_id: {message_id}")
-                    except Exception as e:
-                        debug_print(f"[ERROR] send_notification - Error sending message: {e}")
-                        return
-
-        # Log notification details after successful sending
-        if message_id:
-            print("🎯 Notification Send Successfully 📧")
-            print(f"{{ Notification Message - initial values:\n  [\n"
-                  f"    site_id = {site_id},\n"
-                  f"    message_id = {message_id},\n"
-                  f"    website_type = {website.type if website else None},\n"
-                  f"    country_code = {country_code},\n"
-                  f"    numbers = {numbers},\n"
-                  f"    Flag_URL = {flag_url},\n"
-                  f"    button_count = {len(numbers)},\n"
-                  f"    button_created_using = '{button_created_using}',\n"
-                  f"    settings = {website.settings if website and hasattr(website,'settings') else None},\n"
-                  f"    updated = {data.get('updated', False)},\n"
-                  f"    is_initial_run = {website.is_initial_run},\n"
-                  f"    single_mode = {SINGLE_MODE},\n"
-                  f"    visit_url = {website.url}\n  ]\n}}")
+                    message_id = await send_notification_message(selected_numbers, False, is_single=False)
+
+        # Log notification details after successful sending (INFO is enabled in DEV_MODE)
+        if message_id and logger.isEnabledFor(logging.INFO):
+            # Country code of the first number, only needed for this report
+            country_code = None
+            formatted_number, flag_info = await format_phone_number(numbers[0], get_flag=True, website_url=website.url)
+            if flag_info:  # If we got flag info, we definitely got country code
+                country_code = formatted_number.split(' ')[0] if formatted_number else None
+
+            button_created_using = (
+                "last_number (initial run)" if website.is_initial_run 
+                else "selected_numbers_for_buttons (subsequent run)" if is_multiple 
+                else "last_number"
+            )
+
+            logger.info(
+                "🎯 Notification Send Successfully 📧\n"
+                "{ Notification Message - initial values:\n  [\n"
+                "    site_id = %s,\n"
+                "    message_id = %s,\n"
+                "    website_type = %s,\n"
+                "    country_code = %s,\n"
+                "    numbers = %s,\n"
+                "    Flag_URL = %s,\n"
+                "    button_count = %d,\n"
+                "    button_created_using = '%s',\n"
+                "    settings = %s,\n"
+                "    updated = %s,\n"
+                "    is_initial_run = %s,\n"
+                "    single_mode = %s,\n"
+                "    visit_url = %s\n  ]\n}",
+                site_id, message_id, website.type, country_code, numbers, flag_url, len(numbers),
+                button_created_using, getattr(website, "settings", None), data.get("updated", False),
+                website.is_initial_run, SINGLE_MODE, website.url
+            )
 
     except Exception as e:
-        debug_print(f"[ERROR] send_notification - error: {e}")
+        debug_print("[ERROR] send_notification - error: %s", e)
         return
@@ -1,10 +1,23 @@
 import os
 import json
-from bot.config import debug_print, DEV_MODE
+import asyncio
+import logging
+from bot.config import debug_print, DEV_MODE, DURABLE_SAVES
 from typing import Dict, Optional
 from uuid import uuid4
 from bot.utils import NotificationState
 
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before writing the data file, so bursts of saves become one write
+SAVE_DELAY = 0.5
+
+# orjson is optional; the standard json module is used when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # Storage
 storage = {
@@ -14,147 +27,200 @@ storage = {
     "latest_notification": {"message_id": None, "number": None, "site_id": None, "multiple": False, "is_initial_run": False},
     "active_countdown_tasks": {},
     "notifications": {},  # Store notification states by notification_id
+    "message_notifications": {},  # Map sent message_id -> notification_id
+    "stop_event": asyncio.Event(),  # Set to stop the monitoring loop
+    "background_tasks": set(),  # Fire-and-forget tasks, referenced until they finish
+    "data_cache": None,  # Saved website data, read from file once and then kept in memory
+    "flush_task": None,  # Pending delayed write of data_cache
+    "write_lock": asyncio.Lock(),  # Keeps file writes from overlapping
 }
 
+def track_background_task(task: asyncio.Task) -> asyncio.Task:
+    """Keep a reference to a background task until it finishes"""
+    storage["background_tasks"].add(task)
+    task.add_done_callback(storage["background_tasks"].discard)
+    return task
+
+async def cancel_background_tasks():
+    """Cancel pending background tasks and wait for them to finish"""
+    tasks = list(storage["background_tasks"])
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _dumps(data) -> bytes:
+    """Serialize data to compact JSON bytes"""
+    if orjson:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+def _loads(raw: bytes):
+    """Parse JSON bytes (orjson.JSONDecodeError subclasses json.JSONDecodeError)"""
+    if orjson:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _read_file(path: str) -> bytes:
+    """Read a file's bytes (run in a worker thread)"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def _write_file(path: str, payload: bytes):
+    """Write payload through a temp file and swap it in atomically (run in a worker thread)"""
+    # A crash mid-write never leaves a truncated data file
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(payload)
+        if DURABLE_SAVES:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
 async def load_website_data():
     """Load website data from file"""
     data = {}
     if os.path.exists(storage["file"]):
         try:
-            with open(storage["file"], "r") as f:
-                data = json.load(f)
-                debug_print(f"[DEBUG] load_website_data - loaded data from file: {data}")
-
-                # Load data for each website
-                for site_id, website in storage["websites"].items():
-                    if site_id in data:
-                        debug_print(f"[DEBUG] load_website_data - loading data for {site_id}")
-                        # Load last_number from the file for all website types
-                        website.last_number = data[site_id].get("last_number")
-
-                        # For multiple numbers website, also load latest_numbers
-                        if website.type == "multiple":
-                            # Load previous_last_number if it exists
-                            if "previous_last_number" in data[site_id]:
-                                website.previous_last_number = data[site_id]["previous_last_number"]
-                            else:
-                                website.previous_last_number = website.last_number
-                                
-                            latest_numbers = data[site_id].get("latest_numbers", [])
-                            if latest_numbers:
-                                website.latest_numbers = latest_numbers
-
-                                # If last_number is not set, extract it from first element
-                                if website.last_number is None and latest_numbers:
-                                    first_num = latest_numbers[0]
-                                    if isinstance(first_num, str) and first_num.startswith("+"):
-                                        first_num = first_num[1:]
-                                    try:
-                                        website.last_number = int(first_num)
-                                    except (ValueError, TypeError):
-                                        website.last_number = None
-
-                        # Load button_updated state if it exists
-                        if "button_updated" in data[site_id]:
-                            website.button_updated = data[site_id]["button_updated"]
-                            debug_print(f"[DEBUG] load_website_data - loaded button_updated={website.button_updated} for {site_id}")
+            data = _loads(await asyncio.to_thread(_read_file, storage["file"]))
+            debug_print("[DEBUG] load_website_data - loaded data from file: %s", data)
+
+            # Load data for each website
+            for site_id, website in storage["websites"].items():
+                if site_id in data:
+                    debug_print("[DEBUG] load_website_data - loading data for %s", site_id)
+                    # Load last_number from the file for all website types
+                    website.last_number = data[site_id].get("last_number")
+
+                    # For multiple numbers website, also load latest_numbers
+                    if website.type == "multiple":
+                        # Load previous_last_number if it exists
+                        if "previous_last_number" in data[site_id]:
+                            website.previous_last_number = data[site_id]["previous_last_number"]
+                        else:
+                            website.previous_last_number = website.last_number
+                            
+                        latest_numbers = data[site_id].get("latest_numbers", [])
+                        if latest_numbers:
+                            website.latest_numbers = latest_numbers
+
+                            # If last_number is not set, extract it from first element
+                            if website.last_number is None and latest_numbers:
+                                first_num = latest_numbers[0]
+                                if isinstance(first_num, str) and first_num.startswith("+"):
+                                    first_num = first_num[1:]
+                                try:
+                                    website.last_number = int(first_num)
+                                except (ValueError, TypeError):
+                                    website.last_number = None
+
+                    # Load button_updated state if it exists
+                    if "button_updated" in data[site_id]:
+                        website.button_updated = data[site_id]["button_updated"]
+                        debug_print("[DEBUG] load_website_data - loaded button_updated=%s for %s", website.button_updated, site_id)
         except (json.JSONDecodeError, IOError) as e:
             print(f"Error loading website data: {e}")
 
+    storage["data_cache"] = data
     return data
 
+def _website_record(website) -> dict:
+    """Build the saved JSON record for one website"""
+    # WebsiteMonitor always defines these attributes, so read them directly
+    if website.type == "multiple":
+        # For multiple numbers websites, save last_number and always include latest_numbers (empty if not set)
+        record = {
+            "last_number": website.last_number,
+            "previous_last_number": website.previous_last_number,
+            "latest_numbers": website.latest_numbers or []
+        }
+    else:
+        # For all other websites, just save the last_number
+        record = {"last_number": website.last_number}
+
+    # Save button_updated state if it was loaded for this website
+    button_updated = getattr(website, "button_updated", None)
+    if button_updated is not None:
+        record["button_updated"] = button_updated
+    return record
+
 async def save_website_data(site_id=None):
-    # Load existing data
-    data = {}
-    if os.path.exists(storage["file"]):
+    # Saved data stays in memory after the first read, so a save only merges and writes
+    data = storage["data_cache"]
+    if data is None and os.path.exists(storage["file"]):
         try:
-            with open(storage["file"], "r") as f:
-                data = json.load(f)
-                # Print only site-specific data if site_id is specified
-                if site_id and site_id in data:
-                    # Format just the specific site data nicely
-                    site_data = {site_id: data[site_id]}
-                    formatted_data = json.dumps(site_data)
-                    debug_print(f"[DEBUG] save_website_data - loaded existing data:\n{formatted_data}")
-                else:
-                    # Just mention how many sites were loaded
-                    debug_print(f"[DEBUG] save_website_data - loaded existing data for {len(data)} sites")
+            data = _loads(await asyncio.to_thread(_read_file, storage["file"]))
+            # Print only site-specific data if site_id is specified (json.dumps only in DEV_MODE)
+            if DEV_MODE and site_id and site_id in data:
+                # Format just the specific site data nicely
+                site_data = {site_id: data[site_id]}
+                formatted_data = json.dumps(site_data)
+                debug_print("[DEBUG] save_website_data - loaded existing data:\n%s", formatted_data)
+            else:
+                # Just mention how many sites were loaded
+                debug_print("[DEBUG] save_website_data - loaded existing data for %s sites", len(data))
         except (json.JSONDecodeError, IOError) as e:
-            debug_print(f"[DEBUG] save_website_data - error loading existing data: {e}")
+            debug_print("[DEBUG] save_website_data - error loading existing data: %s", e)
+    if data is None:
+        data = {}
+    storage["data_cache"] = data
 
     # Update data
     if site_id:
         # Update just one website
-        if site_id in storage["websites"]:
-            website = storage["websites"][site_id]
-            
-            # For multiple numbers websites, save last_number and always include latest_numbers (empty if not set)
-            if website.type == "multiple":
-                # Store previous_last_number before updating, if it doesn't exist yet
-                if not hasattr(website, "previous_last_number"):
-                    website.previous_last_number = website.last_number
-                    
-                data[site_id] = {
-                    "last_number": website.last_number,
-                    "previous_last_number": website.previous_last_number if hasattr(website, "previous_last_number") else website.last_number,
-                    "latest_numbers": website.latest_numbers if hasattr(website, "latest_numbers") else []
-                }
-                # Ensure latest_numbers is always an array
-                if data[site_id]["latest_numbers"] is None:
-                    data[site_id]["latest_numbers"] = []
-            else:
-                # For all other websites, just save the last_number
-                data[site_id] = {
-                    "last_number": website.last_number
-                }
-
-            # Save button_updated state if it exists
-            if hasattr(website, "button_updated"):
-                data[site_id]["button_updated"] = website.button_updated
-                # print(f"[DEBUG] save_website_data - saving button_updated={website.button_updated} for {site_id}")
+        website = storage["websites"].get(site_id)
+        if website:
+            data[site_id] = _website_record(website)
+            if DEV_MODE:
+                # Format just the specific site data nicely
+                debug_print("[DEBUG] save_website_data - saved for %s:\n%s", site_id, json.dumps({site_id: data[site_id]}, indent=2))
     else:
         # Update all websites
-        for site_id, website in storage["websites"].items():
-            if website.type == "multiple":
-                # Store previous_last_number before updating, if it doesn't exist yet
-                if not hasattr(website, "previous_last_number"):
-                    website.previous_last_number = website.last_number
-                    
-                data[site_id] = {
-                    "last_number": website.last_number,
-                    "previous_last_number": website.previous_last_number if hasattr(website, "previous_last_number") else website.last_number,
-                    "latest_numbers": website.latest_numbers if hasattr(website, "latest_numbers") else []
-                }
-                if data[site_id]["latest_numbers"] is None:
-                    data[site_id]["latest_numbers"] = []
-            else:
-                data[site_id] = {
-                    "last_number": website.last_number
-                }
-            if hasattr(website, "button_updated"):
-                data[site_id]["button_updated"] = website.button_updated
+        for target_id, website in storage["websites"].items():
+            data[target_id] = _website_record(website)
+        debug_print("[DEBUG] save_website_data - saved data for %s sites", len(storage["websites"]))
+
+    # Write shortly, together with any other saves made in the meantime
+    flush_task = storage["flush_task"]
+    if flush_task is None or flush_task.done():
+        storage["flush_task"] = asyncio.create_task(_flush_after_delay())
+
+async def _flush_after_delay():
+    """Write the data file once SAVE_DELAY has passed"""
+    await asyncio.sleep(SAVE_DELAY)
+    # Saves from here on schedule a new flush, since this one serializes the data now
+    storage["flush_task"] = None
+    await _write_website_data()
+
+async def _write_website_data():
+    """Write data_cache to the data file without blocking the event loop"""
+    data = storage["data_cache"]
+    if data is None:
+        return
 
-    # Save to file
     try:
-        with open(storage["file"], "w") as f:
-            json.dump(data, f)
-            
-            # For debug output, only show relevant site data if a specific site_id is provided
-            if site_id and site_id in data:
-                # Format just the specific site data nicely
-                site_data = {site_id: data[site_id]}
-                formatted_data = json.dumps(site_data, indent=2)
-                debug_print(f"[DEBUG] save_website_data - saved for {site_id}:\n{formatted_data}")
-            else:
-                # Just mention how many sites were saved
-                debug_print(f"[DEBUG] save_website_data - saved data for {len(data)} sites")
-    except IOError as e:
-        print(f"Error saving website data: {e}")
+        # Serialize on the loop for a consistent snapshot, into one buffer so the file gets a single write
+        payload = _dumps(data)
+        async with storage["write_lock"]:
+            await asyncio.to_thread(_write_file, storage["file"], payload)
+        debug_print("[DEBUG] save_website_data - wrote data for %s sites", len(data))
+    except (OSError, TypeError, ValueError) as e:
+        # Logged at ERROR so a lost save shows up outside DEV_MODE too
+        logger.error("[ERROR] save_website_data - error writing website data: %s", e)
+
+async def flush_website_data():
+    """Wait for pending website data writes to finish (used on shutdown)"""
+    flush_task = storage["flush_task"]
+    if flush_task is not None:
+        await flush_task
+    # Let a write that is already running complete
+    async with storage["write_lock"]:
+        pass
 
 async def save_last_number(number, site_id):
     """Save last number for a specific website"""
-    if site_id in storage["websites"]:
-        website = storage["websites"][site_id]
+    website = storage["websites"].get(site_id)
+    if website:
         website.last_number = number
         await save_website_data(site_id)
 
@@ -175,6 +241,11 @@ def get_notification_state(notification_id: str) -> Optional[NotificationState]:
     """Get a notification state by its ID"""
     return storage["notifications"].get(notification_id)
 
+def get_notification_state_by_message(message_id: int) -> Optional[NotificationState]:
+    """Get the notification state attached to a sent message"""
+    notification_id = storage["message_notifications"].get(message_id)
+    return storage["notifications"].get(notification_id) if notification_id else None
+
 def update_notification_state(notification_id: str, **kwargs) -> Optional[NotificationState]:
     """Update a notification state with new values"""
     state = get_notification_state(notification_id)
@@ -182,4 +253,7 @@ def update_notification_state(notification_id: str, **kwargs) -> Optional[Notifi
         for key, value in kwargs.items():
             if hasattr(state, key):
                 setattr(state, key, value)
+        # Index by message_id so handlers can find the state without a scan
+        if kwargs.get("message_id") is not None:
+            storage["message_notifications"][kwargs["message_id"]] = notification_id
     return state
@@ -1,13 +1,14 @@
-import os
 import re
+import time
 import asyncio
 import aiohttp
 from typing import Tuple, Optional, List, Union, Dict
 from bs4 import BeautifulSoup, SoupStrainer
-from bot.api import APIClient
-from bot.config import debug_print, DEV_MODE
-from dataclasses import dataclass
-from aiogram.types import InlineKeyboardButton
+from bot.api import APIClient, get_session
+from bot.config import debug_print, DEV_MODE, URL
+from dataclasses import dataclass, field
+from functools import lru_cache
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 # Pre-compile regex patterns for better performance
 CLEAN_NUMBER = re.compile(r'[\s\-+]')
@@ -82,18 +83,30 @@ class CountryDetector:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._sorted_codes = sorted(COUNTRY_CODES.keys(), key=len, reverse=True)
+            cls._max_code_len = len(cls._sorted_codes[0])
+            cls._detected = {}  # number prefix -> (country_code, iso_code, flag_url)
         return cls._instance
     
     def detect_country(self, number_str: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """Single method to detect country code, ISO code, and flag URL"""
+        # The match only depends on the leading digits, so cache by that prefix
+        prefix = number_str[:self._max_code_len]
+        result = self._detected.get(prefix)
+        if result is not None:
+            return result
+
+        result = (None, None, None)
         for code in self._sorted_codes:
-            if number_str.startswith(code):
+            if prefix.startswith(code):
                 iso_code = COUNTRY_CODES[code]
                 if isinstance(iso_code, list):
                     iso_code = iso_code[0]
                 flag_url = f"https://flagpedia.net/data/flags/w580/{iso_code.lower()}.png"
-                return code, iso_code, flag_url
-        return None, None, None
+                result = (code, iso_code, flag_url)
+                break
+
+        self._detected[prefix] = result
+        return result
 
 # Centralized network configuration
 class NetworkConfig:
@@ -108,6 +121,20 @@ class NetworkConfig:
     MAX_RETRIES = 3
     RETRY_DELAY = 5
 
+class RateLimiter:
+    """Space out calls so that at most `rate` of them start per second"""
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def wait(self):
+        """Wait for the next free slot"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
 # Dynamic strategy caching class (NO @dataclass - complex logic with caching)
 class ParsingStrategyCache:
     """Cache successful parsing strategies per URL domain for performance optimization"""
@@ -154,7 +181,7 @@ class ParsingStrategyCache:
 # Global strategy cache instance
 _strategy_cache = ParsingStrategyCache()
 
-@dataclass
+@dataclass(slots=True)
 class KeyboardData:
     """Standardized keyboard data structure for all keyboard types"""
     site_id: str
@@ -184,6 +211,7 @@ class NotificationState:
     is_initial_run: bool = True
     single_mode: bool = False
     message_id: Optional[int] = None
+    keyboard: Optional[InlineKeyboardMarkup] = field(default=None, repr=False, compare=False)  # Main view sent with the message
     
     def to_keyboard_data(self, website_url: str) -> 'KeyboardData':
         """Convert notification state to keyboard data"""
@@ -203,7 +231,7 @@ class NotificationState:
 # Helper function to get base URL from environment variable
 def get_base_url() -> str:
     """Get the base URL from environment variable without hardcoding any URL"""
-    url = os.getenv('URL', '')
+    url = URL or ""
     if not url:
         return ""
 
@@ -218,7 +246,8 @@ def get_base_url() -> str:
 
     return url
 
-# Helper function to extract website name from URL
+# Helper function to extract website name from URL (pure, so results are cached)
+@lru_cache(maxsize=256)
 def extract_website_name(url: str, website_type: str, use_domain_only: bool = False, 
                         button_format: bool = False, status: Optional[str] = None) -> str:
     if not url:
@@ -278,16 +307,17 @@ async def fetch_url_content(url):
 
     for attempt in range(NetworkConfig.MAX_RETRIES):
         try:
-            async with aiohttp.ClientSession(timeout=NetworkConfig.TIMEOUT) as session:
-                async with session.get(url, headers=NetworkConfig.HEADERS, allow_redirects=True) as response:
-                    return await response.text()
+            # Shared session, so repeated polls reuse pooled connections instead of a new handshake each time
+            session = await get_session()
+            async with session.get(url, headers=NetworkConfig.HEADERS, allow_redirects=True, timeout=NetworkConfig.TIMEOUT) as response:
+                return await response.text()
                         
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
-            debug_print(f"⚠️ Request failed for {url} (attempt {attempt+1}/{NetworkConfig.MAX_RETRIES}): {e}")
+            debug_print("⚠️ Request failed for %s (attempt %s/%s): %s", url, attempt + 1, NetworkConfig.MAX_RETRIES, e)
             if attempt < NetworkConfig.MAX_RETRIES - 1:
                 await asyncio.sleep(NetworkConfig.RETRY_DELAY)
             else:
-                debug_print(f"⚠️ Max retries reached for {url}. Giving up.")
+                debug_print("⚠️ Max retries reached for %s. Giving up.", url)
     return ""
     
 
@@ -301,7 +331,7 @@ async def parse_website_content(url, website_type):
     if cached_strategy == "html":
         cached_selector = _strategy_cache.get_cached_selector(url)
         if cached_selector:
-            debug_print(f"[CACHE HIT] Using cached HTML selector '{cached_selector}' for {url}")
+            debug_print("[CACHE HIT] Using cached HTML selector '%s' for %s", cached_selector, url)
             
             page_content = await fetch_url_content(url)
             if page_content:
@@ -315,7 +345,7 @@ async def parse_website_content(url, website_type):
                     return (numbers[0] if len(numbers) == 1 else numbers), flag_url
     
     elif cached_strategy == "json":
-        debug_print(f"[CACHE HIT] Using cached JSON API strategy for {url}")
+        debug_print("[CACHE HIT] Using cached JSON API strategy for %s", url)
         try:
             api_client = APIClient(url)
             json_numbers = await api_client.fetch_json_numbers()
@@ -325,10 +355,10 @@ async def parse_website_content(url, website_type):
                 _, _, flag_url = detector.detect_country(first_number_str)
                 return (json_numbers[0] if len(json_numbers) == 1 else json_numbers), flag_url
         except Exception as e:
-            debug_print(f"Cached JSON API failed: {e}")
+            debug_print("Cached JSON API failed: %s", e)
             
     elif cached_strategy == "api_keys":
-        debug_print(f"[CACHE HIT] Using cached API Keys strategy for {url}")
+        debug_print("[CACHE HIT] Using cached API Keys strategy for %s", url)
         try:
             api_client = APIClient(url)
             active_numbers = await api_client.get_active_numbers_by_country()
@@ -340,10 +370,10 @@ async def parse_website_content(url, website_type):
                 _strategy_cache.cache_strategy(url, "api_keys")
                 return (numbers[0] if len(numbers) == 1 else numbers), flag_url
         except Exception as e:
-            debug_print(f"Cached API Keys failed: {e}")
+            debug_print("Cached API Keys failed: %s", e)
     
     # ===== PHASE 3: CACHE MISS - TRY ALL STRATEGIES =====
-    debug_print(f"[CACHE MISS] Trying all strategies for {url}")
+    debug_print("[CACHE MISS] Trying all strategies for %s", url)
     
     # Strategy 1: HTML Selectors
     page_content = await fetch_url_content(url)
@@ -366,7 +396,7 @@ async def parse_website_content(url, website_type):
                 
                 # 🎯 CACHE THE SUCCESSFUL STRATEGY
                 _strategy_cache.cache_strategy(url, "html", selector)
-                debug_print(f"[CACHE SAVE] Cached HTML selector '{selector}' for {url}")
+                debug_print("[CACHE SAVE] Cached HTML selector '%s' for %s", selector, url)
                 
                 return (numbers[0] if len(numbers) == 1 else numbers), flag_url
     
@@ -382,12 +412,12 @@ async def parse_website_content(url, website_type):
             
             # 🎯 CACHE THE SUCCESSFUL STRATEGY
             _strategy_cache.cache_strategy(url, "json")
-            debug_print(f"[CACHE SAVE] Cached JSON API strategy for {url}")
+            debug_print("[CACHE SAVE] Cached JSON API strategy for %s", url)
             
             return (json_numbers[0] if len(json_numbers) == 1 else json_numbers), flag_url
             
     except Exception as api_error:
-        debug_print(f"[ERROR] JSON API failed: {api_error}")
+        debug_print("[ERROR] JSON API failed: %s", api_error)
     
     # Strategy 3: API Keys (Final Fallback)
     try:
@@ -402,36 +432,42 @@ async def parse_website_content(url, website_type):
             
             # 🎯 CACHE THE SUCCESSFUL STRATEGY
             _strategy_cache.cache_strategy(url, "api_keys")
-            debug_print(f"[CACHE SAVE] Cached API Keys strategy for {url}")
+            debug_print("[CACHE SAVE] Cached API Keys strategy for %s", url)
             
             return (numbers[0] if len(numbers) == 1 else numbers), flag_url
             
     except Exception as api_error:
-        debug_print(f"[ERROR] API Keys failed: {api_error}")
+        debug_print("[ERROR] API Keys failed: %s", api_error)
     
     # ===== PHASE 4: ALL STRATEGIES FAILED =====
     _strategy_cache.mark_failure(url)
-    debug_print(f"[FAILURE] All parsing strategies failed for {url}")
+    debug_print("[FAILURE] All parsing strategies failed for %s", url)
     return None, None
 
 
-async def format_phone_number(number: Union[str, int], remove_code: bool = False, 
-                             get_flag: bool = False, website_url: Optional[str] = None) -> Union[str, Tuple[str, Optional[dict]]]:
-    """Optimized phone number formatting with centralized country detection"""
-    if not number:
-        return (None, None) if get_flag else None
-        
+@lru_cache(maxsize=2048)
+def _format_number(number: str, remove_code: bool) -> Tuple[str, Optional[str], Optional[str]]:
+    """Format a raw number once and cache the result with its ISO code and flag URL"""
     # Clean and normalize input number (removes spaces, dashes, and +)
-    number_str = CLEAN_NUMBER.sub('', str(number))
+    number_str = CLEAN_NUMBER.sub('', number)
     detector = CountryDetector()
     country_code, iso_code, flag_url = detector.detect_country(number_str)
     
     if not country_code:
-        formatted = number_str if remove_code else f"+{number_str}"
-        return (formatted, None) if get_flag else formatted
+        return (number_str if remove_code else f"+{number_str}"), None, None
     
     rest_of_number = number_str[len(country_code):]
     formatted = rest_of_number if remove_code else f"+{country_code} {rest_of_number}"
+    return formatted, iso_code, flag_url
+
+
+async def format_phone_number(number: Union[str, int], remove_code: bool = False, 
+                             get_flag: bool = False, website_url: Optional[str] = None) -> Union[str, Tuple[str, Optional[dict]]]:
+    """Optimized phone number formatting with centralized country detection"""
+    if not number:
+        return (None, None) if get_flag else None
+        
+    formatted, iso_code, flag_url = _format_number(str(number), remove_code)
     
     if get_flag:
         flag_data = {"primary": flag_url, "iso_code": iso_code.lower()} if iso_code else None
@@ -467,10 +503,8 @@ async def get_country_info_from_number(number: Union[str, int]) -> Tuple[Optiona
     if not number:
         return None, None
         
-    # Convert to string and remove any '+' prefix
-    number_str = CLEAN_NUMBER.sub('', str(number))
-    detector = CountryDetector()
-    _, iso_code, flag_url = detector.detect_country(number_str)
+    # Shares the cached lookup used by format_phone_number
+    _, iso_code, flag_url = _format_number(str(number), False)
 
     return iso_code, flag_url
             
@@ -484,6 +518,14 @@ async def delete_message_after_delay(bot, message, delay_seconds):
         print(f"Error deleting message: {e}")
 
 
+async def edit_reply_markup_if_changed(message, reply_markup) -> bool:
+    """Edit a message's keyboard, skipping the API call when it is unchanged"""
+    if message.reply_markup == reply_markup:
+        return False
+    await message.edit_reply_markup(reply_markup=reply_markup)
+    return True
+
+
 def parse_callback_data(callback_data):
     """Parse callback data into parts and site_id"""
     if not callback_data or callback_data == "none":
@@ -503,4 +545,15 @@ def parse_callback_data(callback_data):
             # Found the combined "site_X" format
             return parts[:i] + parts[i+1:], part
     
-    return parts, None
\ No newline at end of file
+    return parts, None
+
+
+def get_current_page(parts: list) -> int:
+    """Get the page number from split callback data, 0 if not paginated"""
+    # Paginated callbacks always carry the page token third: <action>_monitoring_page_<n>_...
+    if len(parts) > 3 and parts[2] == "page":
+        try:
+            return int(parts[3])
+        except ValueError:
+            return 0
+    return 0
@@ -1,15 +1,41 @@
 import asyncio
+import logging
 import os
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
 from bot.imports import (
     Bot, Dispatcher, TELEGRAM_BOT_TOKEN, DefaultBotProperties, 
+    AiohttpSession, TELEGRAM_CONNECTION_LIMIT,
     WebsiteMonitor, storage, load_website_configs, 
     SINGLE_MODE, register_handlers, send_startup_message, 
-    monitor_websites, send_notification, DEV_MODE, debug_print
+    monitor_websites, send_notification, DEV_MODE, debug_print,
+    close_session, stop_monitoring, cancel_background_tasks, flush_website_data
 )
 
+def setup_logging() -> QueueListener:
+    """Send log records through a queue so console output happens off the event loop"""
+    log_queue = queue.SimpleQueue()
+    # stdout, where debug_print's print() output used to go
+    console = logging.StreamHandler(sys.stdout)
+
+    # The bot logger is at DEBUG in development mode (debug_print, notification reports)
+    # and WARNING otherwise; third-party libraries stay at INFO/WARNING
+    logging.basicConfig(level=logging.INFO if DEV_MODE else logging.WARNING, format="%(message)s", handlers=[QueueHandler(log_queue)])
+
+    listener = QueueListener(log_queue, console)
+    listener.start()
+    return listener
+
 async def main():
-    # Initialize bot with minimal memory footprint
-    bot = Bot(token=TELEGRAM_BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+    log_listener = setup_logging()
+
+    # Initialize bot with minimal memory footprint and its own bounded connection pool
+    bot = Bot(
+        token=TELEGRAM_BOT_TOKEN,
+        session=AiohttpSession(limit=TELEGRAM_CONNECTION_LIMIT),
+        default=DefaultBotProperties(parse_mode="HTML")
+    )
     dp = Dispatcher()
 
     # Register handlers
@@ -27,6 +53,8 @@ async def main():
 
     # Start the bot
     dp_task = asyncio.create_task(dp.start_polling(bot, allowed_updates=["message", "callback_query"]))
+    # Stop monitoring once polling ends so both tasks can finish
+    dp_task.add_done_callback(lambda _: stop_monitoring())
 
     # Send startup message
     await send_startup_message(bot)
@@ -43,7 +71,16 @@ async def main():
     print(f"Single mode status: {'Enabled' if SINGLE_MODE else 'Disabled'}")
 
     # Wait for both tasks to complete (they should run indefinitely)
-    await asyncio.gather(dp_task, monitor_task)
+    try:
+        await asyncio.gather(dp_task, monitor_task)
+    finally:
+        # Stop pending message deletions, write pending website data,
+        # then release pooled HTTP connections on shutdown
+        await cancel_background_tasks()
+        await flush_website_data()
+        await close_session()
+        # Flush any queued log records
+        log_listener.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())